@@ -1,19 +1,21 @@
 import json
 import os
-from typing import List, Dict
+from typing import List, Dict, Optional
 
 from langchain.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
 
 from swe.context import SweContext
+from swe.llm_call import LLMCaller
+from swe.router import ModelRouter
 
 class SweAsk:
 
-    def __init__(self, swe_context: SweContext):
+    def __init__(self, swe_context: SweContext, router: Optional[ModelRouter] = None):
         self.swe_context = swe_context
-        self.llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+        self.router = router or ModelRouter()
+        self.caller = LLMCaller(self.router)
 
-    def ask(self, question: str, verbose: bool = False) -> str:
+    def ask(self, question: str, verbose: bool = False, stage: str = "ask") -> str:
         context_content = self.swe_context._get_context_content(verbose)
         chat_history = self.swe_context._load_chat_history()
 
@@ -27,30 +29,28 @@ class SweAsk:
             "Using this information, address the following request as concisely as possible:\n\nREQUEST: {question}"
         )
 
-        chain = prompt_template | self.llm
+        formatted_prompt = prompt_template.format(
+            context=context_content, history=formatted_history, question=question
+        )
+        prompt_tokens = self.swe_context._count_tokens(formatted_prompt)
+        route = self.router.select(stage, prompt_tokens)
+        chain = prompt_template | self.router.get_llm(route)
 
         if verbose:
             print("\n" + "=" * 80)
             print(" " * 30 + "PROMPT TO LLM")
             print("=" * 80 + "\n")
-            formatted_prompt = prompt_template.format(
-                context=context_content, history=formatted_history, question=question
-            )
             print(formatted_prompt)
             print("\n" + "=" * 80 + "\n")
-
-        try:
-            response = chain.invoke({
-                "context": context_content,
-                "history": formatted_history,
-                "question": question
-            })
-            print(f"\n\n{response.content}")
-            chat_history.append({"role": "user", "content": question})
-            chat_history.append({'role': 'assistant', 'content': response.content})
-        except Exception as e:
-            print(f"Error generating response: {e}")
-
-        self.swe_context._save_chat_history(chat_history)
-
-        return response.content
\ No newline at end of file
+            print(f"Routing {stage} ({prompt_tokens} tokens) to {route['model']}")
+
+        # Raises LLMCallError once retries are exhausted; the chat history is left untouched
+        response = self.caller.call(stage, route, prompt_tokens, lambda: chain.invoke({
+            "context": context_content,
+            "history": formatted_history,
+            "question": question
+        }))
+        print(f"\n\n{response.content}")
+        self.swe_context._update_chat_history(chat_history, question, response.content)
+
+        return response.content
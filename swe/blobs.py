@@ -0,0 +1,34 @@
+import hashlib
+import os
+from typing import Optional
+
+
+class BlobStore:
+    """Content-addressed store for file bodies kept out of the chat history."""
+
+    def __init__(self, blob_dir: Optional[str] = None):
+        self.blob_dir = blob_dir or os.path.join(os.path.expanduser("~"), ".swe", "backup", "blobs")
+
+    @staticmethod
+    def digest(content: str) -> str:
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.blob_dir, digest[:2], digest)
+
+    def put(self, content: str) -> str:
+        """Store content and return its sha256 digest. Identical content is stored once."""
+        digest = self.digest(content)
+        path = self._path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(content)
+        return digest
+
+    def get(self, digest: str) -> Optional[str]:
+        path = self._path(digest)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
@@ -2,6 +2,10 @@ import argparse
 from swe.context import SweContext
 from swe.ask import SweAsk
 from swe.implement import SweImplement
+from swe.llm_call import LLMCallError
+from swe.router import ModelRouter
+from swe.sections import SpliceError
+from swe.watch import ContextWatcher
 
 
 def main():
@@ -9,29 +13,43 @@ def main():
     subparsers = parser.add_subparsers(dest="command")
     add_parser = subparsers.add_parser("add")  # Renamed from "add"
     add_parser.add_argument("file", help="File to add to context")
+    add_parser.add_argument("--deps", action="store_true", help="Also add the project files imported by a Python file")
+    add_parser.add_argument("--depth", type=int, default=None, help="Maximum import depth to follow with --deps")
     remove_parser = subparsers.add_parser("rm")  # Renamed from "rm"
     remove_parser.add_argument("file", nargs='?', default=None, help="File to remove from context")
     remove_parser.add_argument("--all", action="store_true", help="Remove all files from context")
     ask_parser = subparsers.add_parser("ask")
     ask_parser.add_argument("question", help="Question to ask the agent")
     ask_parser.add_argument("--verbose", action="store_true", help="Print verbose output")
-    subparsers.add_parser("context", help="List all files in context")
-    subparsers.add_parser("ls", help="List all files in context")
-    subparsers.add_parser("ctx", help="List all files in context")
+    for context_command in ["context", "ls", "ctx"]:
+        context_parser = subparsers.add_parser(context_command, help="List all files in context")
+        context_parser.add_argument("--stats", action="store_true", help="Show a per-file and per-directory token breakdown")
+        context_parser.add_argument("--json", action="store_true", help="Print the token breakdown as JSON")
+        context_parser.add_argument("--depth", type=int, default=2, help="Directory levels to show with --stats")
+        context_parser.add_argument("--top", type=int, default=20, help="Number of heaviest files to show with --stats")
     subparsers.add_parser("newchat", help="Start a new chat")
     subparsers.add_parser("new", help="Start a new chat and clear context")
-    subparsers.add_parser("chat", help="Print the chat history")
+    chat_parser = subparsers.add_parser("chat", help="Print the chat history")
+    chat_parser.add_argument("--expand", action="store_true", help="Include the full file bodies of implementations")
     implement_parser = subparsers.add_parser("implement")
-    implement_parser.add_argument("question", help="Implementation request")
+    implement_parser.add_argument("question", nargs='?', default=None, help="Implementation request")
+    implement_parser.add_argument("--resume", metavar="RUN_ID", help="Resume an interrupted run")
     implement_parser.add_argument("--verbose", action="store_true", help="Print verbose output")
+    subparsers.add_parser("runs", help="List resumable implementation runs")
+    watch_parser = subparsers.add_parser("watch", help="Keep context and caches up to date as files change")
+    watch_parser.add_argument("--interval", type=float, default=1.0, help="Polling interval in seconds")
+    subparsers.add_parser("routes", help="Show latency and cost per model route")
 
     args = parser.parse_args()
 
     swe_context = SweContext()
-    swe_ask = SweAsk(swe_context)
-    swe_implement = SweImplement(swe_context)
+    router = ModelRouter()
+    swe_ask = SweAsk(swe_context, router)
     if args.command == "add":
-        swe_context.add_file(args.file)
+        if args.deps:
+            swe_context.add_dependencies(args.file, args.depth)
+        else:
+            swe_context.add_file(args.file)
     elif args.command == "rm":
         if args.all:
             swe_context.remove_all_files()
@@ -40,17 +58,37 @@ def main():
         else:
             print("Please specify a file to remove or use --all to remove all files.")
     elif args.command in ["context", "ls", "ctx"]:
-        swe_context.show_context()
+        model, context_window = router.context_window()
+        if args.stats or args.json:
+            swe_context.show_context_stats(model, context_window, args.depth, args.top, args.json)
+        else:
+            swe_context.show_context(model, context_window)
     elif args.command == "chat":
-        swe_context.print_chat()
+        swe_context.print_chat(args.expand)
     elif args.command == "newchat":  # Handle new command
         swe_context.clear_conversation()
     elif args.command == "new":  # Handle new command
         swe_context.clear_conversation()
         swe_context.remove_all_files()
     elif args.command == "ask":
-        swe_ask.ask(args.question, args.verbose)
+        try:
+            swe_ask.ask(args.question, args.verbose)
+        except LLMCallError as e:
+            print(f"Error generating response: {e}")
     elif args.command == "implement":
-        swe_implement.implement(args.question, args.verbose)
+        if not args.question and not args.resume:
+            print("Please specify an implementation request or use --resume <run id>.")
+            return
+        try:
+            SweImplement(swe_context, router).implement(args.question, args.verbose, args.resume)
+        except (LLMCallError, SpliceError) as e:
+            print(f"Implementation aborted: {e}")
+    elif args.command == "runs":
+        SweImplement(swe_context, router).show_runs()
+    elif args.command == "watch":
+        model, _ = router.context_window()
+        ContextWatcher(swe_context, model, args.interval).watch()
+    elif args.command == "routes":
+        router.show_summary()
     else:
         parser.print_help()
\ No newline at end of file
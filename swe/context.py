@@ -3,13 +3,17 @@ import os
 import shutil
 from typing import List, Dict, Optional
 import tiktoken
+from swe.blobs import BlobStore
+from swe.imports import ImportGraph
 from swe.paths import PathHandler
 
 class SweContext:
-    def __init__(self):
-        self.swe_dir = os.path.join(os.path.expanduser("~"), ".swe")
+    def __init__(self, swe_dir: Optional[str] = None):
+        self.swe_dir = swe_dir or os.path.join(os.path.expanduser("~"), ".swe")
         self.context_path = os.path.join(self.swe_dir, "context.json")
         self.ignore_path = os.path.join(self.swe_dir, ".sweignore")
+        self.token_cache_path = os.path.join(self.swe_dir, "token_cache.json")
+        self.blob_dir = os.path.join(self.swe_dir, "backup", "blobs")
         self.default_ignores = [
             ".git/",
             "__pycache__/",
@@ -25,8 +29,8 @@ class SweContext:
             "poetry.lock",
             ".pytest_cache/",
         ]
-        self.chat_file = os.path.join(os.path.expanduser("~"), ".swe", "chat.json")
-        os.makedirs(os.path.dirname(self.chat_file), exist_ok=True)
+        self.chat_file = os.path.join(self.swe_dir, "chat.json")
+        os.makedirs(self.swe_dir, exist_ok=True)
 
     def init(self) -> None:
         os.makedirs(self.swe_dir, exist_ok=True)
@@ -76,12 +80,16 @@ class SweContext:
         except (UnicodeDecodeError, IOError, OSError):
             return False
 
-    def _should_ignore(self, path: str) -> bool:
+    def _load_ignore_patterns(self) -> List[str]:
         try:
             with open(self.ignore_path, 'r') as f:
-                ignore_patterns = [p.strip() for p in f.readlines() if p.strip() and not p.startswith('#')]
+                return [p.strip() for p in f.readlines() if p.strip() and not p.startswith('#')]
         except FileNotFoundError:
-            ignore_patterns = self.default_ignores
+            return self.default_ignores
+
+    def _should_ignore(self, path: str, ignore_patterns: Optional[List[str]] = None) -> bool:
+        if ignore_patterns is None:
+            ignore_patterns = self._load_ignore_patterns()
 
         norm_path = os.path.normpath(path)
         
@@ -131,22 +139,58 @@ class SweContext:
                 print(f"Added {path_to_display} to context.")
         else:
             added_files = 0
+            ignore_patterns = self._load_ignore_patterns()
             for root, _, files in os.walk(path):
-                if self._should_ignore(root):
+                if self._should_ignore(root, ignore_patterns):
                     continue
                 for file in files:
                     file_path = os.path.join(root, file)
                     abs_path = os.path.abspath(file_path)
-                    if not self._should_ignore(abs_path):
+                    if not self._should_ignore(abs_path, ignore_patterns):
                         if abs_path not in data["context"] and self._is_readable_file(file_path):
                             data["context"].append(abs_path)
                             added_files += 1
+            # Remember the directory so 'swe watch' can pick up files created later
+            abs_dir = os.path.abspath(path)
+            directories = data.setdefault("directories", [])
+            if abs_dir not in directories:
+                directories.append(abs_dir)
+            self._save_context(data)
             if added_files > 0:
-                self._save_context(data)
                 print(f"Added {added_files} files from {path} to context.")
             else:
                 print(f"No new files found in {path}.")
 
+    def add_dependencies(self, path: str, depth: Optional[int] = None) -> None:
+        """Add a Python file and the project files it imports, up to depth levels."""
+        if not os.path.isfile(path):
+            print(f"File {path} does not exist.")
+            return
+
+        data = self._load_context()
+        if data is None:
+            return
+
+        import_graph = ImportGraph(
+            root=ImportGraph.find_project_root(path),
+            cache_path=os.path.join(self.swe_dir, "imports.json"),
+        )
+        ignore_patterns = self._load_ignore_patterns()
+        added_files = 0
+        for file_path in import_graph.dependencies(path, depth):
+            if file_path in data["context"] or self._should_ignore(file_path, ignore_patterns):
+                continue
+            if self._is_readable_file(file_path):
+                data["context"].append(file_path)
+                added_files += 1
+
+        path_to_display = PathHandler.get_path_to_display(os.path.abspath(path))
+        if added_files > 0:
+            self._save_context(data)
+            print(f"Added {added_files} files from {path_to_display} and its imports to context.")
+        else:
+            print(f"No new files found for {path_to_display} and its imports.")
+
     def remove_file(self, path: str) -> None:
         data = self._load_context()
         if data is None:
@@ -166,6 +210,8 @@ class SweContext:
             original_count = len(data["context"])
             data["context"] = [f for f in data["context"] 
                              if not os.path.normpath(f).startswith(absolute_path)]
+            data["directories"] = [d for d in data.get("directories", [])
+                                   if not os.path.normpath(d).startswith(absolute_path)]
             removed_files = original_count - len(data["context"])
             self._save_context(data)
             
@@ -179,17 +225,151 @@ class SweContext:
         if data is None:
             return
         data["context"] = []
+        data["directories"] = []
         self._save_context(data)
         print("All files removed from context.")
 
-    def show_context(self) -> None:
-        self._display_token_usage()
+    def show_context(self, model: str = 'gpt-4o', context_window: int = 128000) -> None:
+        self._display_token_usage(model, context_window)
         data = self._load_context()
         if data is None:
             return
         for file in data["context"]:
             print(f"    +  {PathHandler.get_path_to_display(file)}")
 
+    def _load_token_cache(self) -> Dict[str, Dict]:
+        if os.path.exists(self.token_cache_path):
+            try:
+                with open(self.token_cache_path, "r") as f:
+                    return json.load(f)
+            except (json.JSONDecodeError, IOError):
+                print("Warning: Could not read token cache. Rebuilding it.")
+        return {}
+
+    def _save_token_cache(self, cache: Dict[str, Dict]) -> None:
+        try:
+            with open(self.token_cache_path, "w") as f:
+                json.dump(cache, f)
+        except IOError as e:
+            print(f"Error saving token cache: {e}")
+
+    def _get_file_stats(self, model: str = 'gpt-4o') -> List[Dict]:
+        """Returns path, bytes and tokens for each context file.
+
+        Token counts are cached per file mtime and size, so only changed files are re-tokenized.
+        """
+        data = self._load_context()
+        if data is None:
+            return []
+        cache = self._load_token_cache()
+        encoding_name = self._get_encoding(model).name
+        changed = False
+        stats = []
+        for file in data["context"]:
+            try:
+                stat = os.stat(file)
+            except OSError:
+                continue
+            cached = cache.get(file)
+            if (cached is None or cached["mtime"] != stat.st_mtime or cached["bytes"] != stat.st_size
+                    or cached["encoding"] != encoding_name):
+                try:
+                    with open(file, "r") as f:
+                        tokens = self._count_tokens(f.read(), model)
+                except (UnicodeDecodeError, OSError):
+                    continue
+                cached = {"mtime": stat.st_mtime, "bytes": stat.st_size, "encoding": encoding_name, "tokens": tokens}
+                cache[file] = cached
+                changed = True
+            stats.append({"path": file, "bytes": cached["bytes"], "tokens": cached["tokens"]})
+        if changed:
+            self._save_token_cache(cache)
+        return stats
+
+    def _get_chat_tokens(self, model: str = 'gpt-4o') -> int:
+        chat_history = self._load_chat_history()
+        formatted_history = "\n".join([f'{msg["role"].capitalize()}: {msg["content"]}' for msg in chat_history])
+        return self._count_tokens(formatted_history, model)
+
+    @staticmethod
+    def _aggregate_directories(file_stats: List[Dict]) -> Dict[str, Dict]:
+        """Sums file stats up every ancestor directory of the displayed paths."""
+        directories: Dict[str, Dict] = {}
+        for file_stat in file_stats:
+            directory = os.path.dirname(PathHandler.get_path_to_display(file_stat["path"]))
+            while True:
+                entry = directories.setdefault(directory, {"tokens": 0, "bytes": 0, "files": 0})
+                entry["tokens"] += file_stat["tokens"]
+                entry["bytes"] += file_stat["bytes"]
+                entry["files"] += 1
+                parent = os.path.dirname(directory)
+                if parent == directory:
+                    break
+                directory = parent
+        return directories
+
+    def get_context_stats(self, model: str = 'gpt-4o', context_window: int = 128000) -> Dict:
+        file_stats = self._get_file_stats(model)
+        context_tokens = sum(file_stat["tokens"] for file_stat in file_stats)
+        chat_tokens = self._get_chat_tokens(model)
+        directories = self._aggregate_directories(file_stats)
+        return {
+            "model": model,
+            "context_window": context_window,
+            "context_tokens": context_tokens,
+            "chat_tokens": chat_tokens,
+            "total_tokens": context_tokens + chat_tokens,
+            "bytes": sum(file_stat["bytes"] for file_stat in file_stats),
+            "files": sorted(
+                [{**file_stat, "path": PathHandler.get_path_to_display(file_stat["path"])} for file_stat in file_stats],
+                key=lambda entry: entry["tokens"], reverse=True,
+            ),
+            "directories": sorted(
+                [{"path": path, **entry} for path, entry in directories.items() if path],
+                key=lambda entry: entry["tokens"], reverse=True,
+            ),
+        }
+
+    def show_context_stats(self, model: str = 'gpt-4o', context_window: int = 128000, depth: int = 2, top: int = 20, as_json: bool = False) -> None:
+        stats = self.get_context_stats(model, context_window)
+        if as_json:
+            print(json.dumps(stats, indent=4))
+            return
+
+        def percent(tokens: int) -> str:
+            return f"{tokens / context_window * 100:6.2f}%"
+
+        print(f"Model: {model} ({context_window:,} token window)")
+        print(f"Context:      {stats['context_tokens']:>10,} tokens {percent(stats['context_tokens'])}"
+              f"  {len(stats['files'])} files, {stats['bytes'] / 1024:.1f} KB")
+        print(f"Chat history: {stats['chat_tokens']:>10,} tokens {percent(stats['chat_tokens'])}")
+        print(f"Total:        {stats['total_tokens']:>10,} tokens {percent(stats['total_tokens'])}")
+
+        # Directory tree, heaviest first at each level
+        children: Dict[str, List[Dict]] = {}
+        for entry in stats["directories"]:
+            children.setdefault(os.path.dirname(entry["path"]), []).append(entry)
+        directory_paths = {entry["path"] for entry in stats["directories"]}
+        roots = [entry for entry in stats["directories"] if os.path.dirname(entry["path"]) not in directory_paths]
+
+        def print_tree(entries: List[Dict], level: int) -> None:
+            for entry in entries:
+                name = entry["path"] if level == 0 else os.path.basename(entry["path"])
+                label = "    " + "  " * level + name.rstrip("/") + "/"
+                print(f"{label:<48}{entry['tokens']:>10,} {percent(entry['tokens'])}"
+                      f"{entry['bytes'] / 1024:>10.1f} KB{entry['files']:>7} files")
+                if level + 1 < depth:
+                    print_tree(children.get(entry["path"], []), level + 1)
+
+        if roots:
+            print("\nDirectories:")
+            print_tree(roots, 0)
+
+        print(f"\nHeaviest files:")
+        for entry in stats["files"][:top]:
+            label = "    " + entry["path"]
+            print(f"{label:<48}{entry['tokens']:>10,} {percent(entry['tokens'])}{entry['bytes'] / 1024:>10.1f} KB")
+
     def delete_configuration_folder(self) -> None:
         if os.path.exists(self.swe_dir):
             shutil.rmtree(self.swe_dir)
@@ -197,37 +377,42 @@ class SweContext:
         else:
             print("There is no configuration folder to delete.")
 
+    @staticmethod
+    def _get_encoding(model='gpt-4o'):
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            # Models unknown to tiktoken fall back to the gpt-4o tokenizer
+            return tiktoken.get_encoding("o200k_base")
+
     @staticmethod
     def _count_tokens(text, model='gpt-4o'):
         # Load the appropriate tokenizer for the specified model
-        encoding = tiktoken.encoding_for_model(model)
+        encoding = SweContext._get_encoding(model)
         # Encode the text to get tokens
         tokens = encoding.encode(text)
         # Return the number of tokens
         return len(tokens)
     
-    def _display_token_usage(self, model='gpt-4o'):
+    def _display_token_usage(self, model='gpt-4o', context_window=128000):
         # Get terminal width for dynamic bar size
         terminal_width, _ = shutil.get_terminal_size()
         bar_width = max(30, terminal_width - 40)  # Adjust bar width based on terminal size
 
-        # Get token usage
-        context_content = self._get_context_content()
-        context_tokens = self._count_tokens(context_content, model)
-        chat_history = self._load_chat_history()
-        formatted_history = "\n".join([f'{msg["role"].capitalize()}: {msg["content"]}' for msg in chat_history])
-        chat_tokens = self._count_tokens(formatted_history, model)
+        # Get token usage from the cached per-file counts
+        context_tokens = sum(file_stat["tokens"] for file_stat in self._get_file_stats(model))
+        chat_tokens = self._get_chat_tokens(model)
 
         # Total tokens and max tokens
         total_tokens = context_tokens + chat_tokens
-        max_tokens = 30000000
+        max_tokens = context_window
 
         # Calculate bar splits
         context_ratio = context_tokens / max_tokens
         chat_ratio = chat_tokens / max_tokens
 
-        context_fill = int(context_ratio * bar_width)
-        chat_fill = int(chat_ratio * bar_width)
+        context_fill = min(bar_width, int(context_ratio * bar_width))
+        chat_fill = min(bar_width - context_fill, int(chat_ratio * bar_width))
         empty_fill = bar_width - (context_fill + chat_fill)
 
         # Construct the bar
@@ -251,13 +436,23 @@ class SweContext:
         except OSError as e:
             print(f"Error clearing conversation: {e}")
 
-    def _update_chat_history(self, chat_history: List[Dict[str, str]], question: str, response_content: str) -> None:
-        """Appends the user question and assistant response to the chat history and saves it."""
+    def _update_chat_history(self, chat_history: List[Dict[str, str]], question: str, response_content: str, blob: Optional[str] = None) -> None:
+        """Appends the user question and assistant response to the chat history and saves it.
+
+        If blob is given, the response is a compact record whose full body is kept in the blob store.
+        """
         chat_history.append({"role": "user", "content": question})
-        chat_history.append({'role': 'assistant', 'content': response_content})
+        response_msg = {'role': 'assistant', 'content': response_content}
+        if blob:
+            response_msg["blob"] = blob
+        chat_history.append(response_msg)
         self._save_chat_history(chat_history)
 
-    def print_chat(self) -> None:
+    def print_chat(self, expand: bool = False) -> None:
         chat_history = self._load_chat_history()
+        blob_store = BlobStore(self.blob_dir)
         for msg in chat_history:
             print(f'{msg["role"].capitalize()}: {msg["content"]}')
+            if expand and msg.get("blob"):
+                body = blob_store.get(msg["blob"])
+                print(body if body is not None else f"<blob {msg['blob']} not found>")
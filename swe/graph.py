@@ -1,11 +1,29 @@
-from typing import Annotated, Dict, List, TypedDict, Union
+import ast
+import difflib
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Annotated, Dict, List, Optional, Tuple, Type, TypedDict
+from langchain.prompts import ChatPromptTemplate
+from langgraph.checkpoint.base import BaseCheckpointSaver
 from langgraph.graph import Graph, StateGraph
 from langchain_core.messages import HumanMessage, AIMessage
-from langchain_openai import ChatOpenAI
 from pydantic import BaseModel
+from .blobs import BlobStore
 from .context import SweContext
 from .ask import SweAsk
+from .llm_call import LLMCaller
+from .paths import PathHandler
 from .plan_editor import PlanEditor
+from .router import ModelRouter
+from .sections import (
+    LARGE_FILE_TOKENS, SpliceError, outline, section_source, splice_sections, split_sections,
+    unsplicable_sections,
+)
+
+# Upper bound on concurrent section requests, to stay clear of provider rate limits
+MAX_SECTION_WORKERS = 4
 
 # Define the Pydantic model for structured output
 class ImplementResponse(BaseModel):
@@ -13,30 +31,47 @@ class ImplementResponse(BaseModel):
     content: str
     next_file_to_implement: str
 
+class SectionPlan(BaseModel):
+    file: str
+    sections: List[int]
+    append_new_code: bool
+    next_file_to_implement: str
+
+class SectionResponse(BaseModel):
+    content: str
+
+def strip_code_fences(content: str) -> str:
+    """Remove a markdown code fence wrapping the whole content, if any."""
+    match = re.match(r"\A\s*```(?:[a-zA-Z0-9_\-]+)?\n(.*?)\n?```\s*\Z", content, re.DOTALL)
+    return match.group(1) if match else content
+
+def normalize_content(content: str) -> str:
+    """Strip a wrapping code fence and surrounding whitespace, ending non-empty content with a newline."""
+    content = strip_code_fences(content).strip()
+    return content + "\n" if content else content
+
 class GraphState(TypedDict):
     """State for the implementation graph."""
     question: str
     plan: str
-    context: str
-    chat_history: List[Dict[str, str]]
     current_file: str
     next_file: str
-    implementation: Union[ImplementResponse, str] # Can be Pydantic model or raw string
+    implementation: Optional[ImplementResponse]
     verbose: bool
 
 class PlanNode:
     """Node for generating and processing the implementation plan."""
-    def __init__(self, swe_context: SweContext):
+    def __init__(self, swe_context: SweContext, router: Optional[ModelRouter] = None):
         self.swe_context = swe_context
-        self.swe_ask = SweAsk(swe_context)
-        self.plan_editor = PlanEditor()
+        self.swe_ask = SweAsk(swe_context, router)
+        self.plan_editor = PlanEditor(swe_context.swe_dir)
 
     def __call__(self, state: GraphState) -> GraphState:
         preliminary_prompt = (
             f"You are an expert software engineer. You are going to implement a goal: {state['question']}. "
             "List the steps to implement the goal: which files are going to be edited or created?"
         )
-        plan = self.swe_ask.ask(preliminary_prompt)
+        plan = self.swe_ask.ask(preliminary_prompt, stage="plan")
         self.plan_editor.set_content(plan)
         
         return {
@@ -44,31 +79,48 @@ class PlanNode:
             "plan": plan
         }
 
-class ContextNode:
-    """Node for gathering context and chat history."""
-    def __init__(self, swe_context: SweContext):
-        self.swe_context = swe_context
-
-    def __call__(self, state: GraphState) -> GraphState:
-        context_content = self.swe_context._get_context_content(state['verbose'])
-        chat_history = self.swe_context._load_chat_history()
-        
-        return {
-            **state,
-            "context": context_content,
-            "chat_history": chat_history
-        }
-
 class ImplementationNode:
     """Node for generating implementation."""
-    def __init__(self, swe_context: SweContext):
+    def __init__(self, swe_context: SweContext, router: Optional[ModelRouter] = None):
         self.swe_context = swe_context
-        # Configure LLM for structured output with the ImplementResponse model
-        self.llm = ChatOpenAI(model="gpt-4o", temperature=0).with_structured_output(ImplementResponse)
-
-    def __call__(self, state: GraphState) -> GraphState:
-        from langchain.prompts import ChatPromptTemplate
-        
+        self.router = router or ModelRouter()
+        self.caller = LLMCaller(self.router)
+
+    def _invoke(self, prompt_template: ChatPromptTemplate, prompt_inputs: Dict[str, str], schema: Type[BaseModel], verbose: bool) -> BaseModel:
+        """Route, invoke and record one structured-output implement call."""
+        # Pick the model for this call based on the prompt size
+        prompt_tokens = self.swe_context._count_tokens(prompt_template.format(**prompt_inputs))
+        route = self.router.select("implement", prompt_tokens)
+        if verbose:
+            print(f"Routing implement ({prompt_tokens} tokens) to {route['model']}")
+        chain = prompt_template | self.router.get_llm(route).with_structured_output(schema)
+        # Raises LLMCallError once retries are exhausted, which aborts the run
+        # instead of silently ending it with an error sentinel.
+        return self.caller.call("implement", route, prompt_tokens, lambda: chain.invoke(prompt_inputs))
+
+    def _is_large(self, path: str) -> bool:
+        if not path.endswith(".py") or not os.path.isfile(path):
+            return False
+        with open(path, "r") as f:
+            return self.swe_context._count_tokens(f.read()) > LARGE_FILE_TOKENS
+
+    def _large_files(self, state: GraphState) -> List[str]:
+        """Python files too large to regenerate in one completion that this iteration may edit.
+
+        Once the next file is known only it is considered. Before that (the first iteration),
+        every large Python file in context is a candidate.
+        """
+        next_file = state.get('next_file')
+        if next_file and next_file.lower() != "none":
+            target = os.path.abspath(next_file)
+            return [target] if self._is_large(target) else []
+        # Token counts are cached per file, so this does not re-tokenize the context
+        return [
+            file_stat["path"] for file_stat in self.swe_context._get_file_stats()
+            if file_stat["path"].endswith(".py") and file_stat["tokens"] > LARGE_FILE_TOKENS
+        ]
+
+    def _implement_file(self, state: GraphState, prompt_inputs: Dict[str, str]) -> ImplementResponse:
         # Simplified prompt, as structured output handles JSON format
         prompt_template = ChatPromptTemplate.from_template(
             "You are an expert software engineer with the following task to implement: {goal}\n"
@@ -83,101 +135,198 @@ class ImplementationNode:
             "and the path to the next file to implement (or 'None' if you don't "
             "need to edit any more files)."
         )
+        return self._invoke(prompt_template, prompt_inputs, ImplementResponse, state['verbose'])
+
+    def _implement_sections(self, state: GraphState, prompt_inputs: Dict[str, str], large_files: List[str]) -> Optional[ImplementResponse]:
+        """Regenerate only the sections of a large file that need changes, concurrently.
+
+        Sections that do not splice back into valid Python are regenerated once. Returns None if
+        no file can be split, the model picks a file that is not large or the splice still fails,
+        so the caller falls back to a full rewrite.
+        """
+        parsed = {}
+        outlines = []
+        for path in large_files:
+            try:
+                with open(path, "r") as f:
+                    source = f.read()
+                sections = split_sections(source)
+            except (SyntaxError, UnicodeDecodeError, OSError):
+                continue
+            parsed[path] = (source, sections)
+            outlines.append(f"### File: {PathHandler.get_path_to_display(path)}\n{outline(sections)}")
+        if not parsed:
+            return None
+
+        plan_template = ChatPromptTemplate.from_template(
+            "You are an expert software engineer with the following task to implement: {goal}\n"
+            "Here is the plan to implement the goal:\n"
+            "{plan}\n"
+            "You are implementing code changes ONE FILE AT A TIME. Review the project files and conversation history:\n\n"
+            "CONTEXT:\n"
+            "{context}\n\n"
+            "CONVERSATION:\n"
+            "{history}\n\n"
+            "These files are too large to rewrite at once and are edited section by section:\n\n"
+            "{outlines}\n\n"
+            "Provide the full path to the file to modify next. If it is one of the large files above, list the ids "
+            "of the sections that need changes and whether new top-level code must be appended at the end of the file. "
+            "Also provide the path to the next file to implement after this one (or 'None' if you don't "
+            "need to edit any more files)."
+        )
+        section_plan = self._invoke(plan_template, {**prompt_inputs, "outlines": "\n\n".join(outlines)}, SectionPlan, state['verbose'])
+        target = os.path.abspath(section_plan.file)
+        if target not in parsed:
+            return None
+        source, sections = parsed[target]
+        indices = sorted({index for index in section_plan.sections if 0 <= index < len(sections)})
+        if state['verbose']:
+            print(f"Regenerating {len(indices)} of {len(sections)} sections of {section_plan.file}")
+
+        section_template = ChatPromptTemplate.from_template(
+            "You are an expert software engineer with the following task to implement: {goal}\n"
+            "Here is the plan to implement the goal:\n"
+            "{plan}\n"
+            "You are editing ONE SECTION of the large file {file}. This is the current file:\n\n"
+            "{source}\n\n"
+            "{instruction}\n\n"
+            "Return only the new code for this section, keeping its original indentation. "
+            "Do not repeat any other part of the file."
+        )
 
-        chain = prompt_template | self.llm
-        
-        formatted_history = "\n".join([f'{msg["role"].capitalize()}: {msg["content"]}' for msg in state['chat_history']])
-        
-        try:
-            # Invoke the chain. The result should be an ImplementResponse object.
-            response_obj = chain.invoke({
+        def regenerate(instruction: str) -> str:
+            response = self._invoke(section_template, {
                 "goal": state['question'],
                 "plan": state['plan'],
-                "context": state['context'],
-                "history": formatted_history if formatted_history else "<no messages>"
-            })
-
-            # Update chat history with the raw content (or a representation)
-            # For simplicity, we'll serialize the Pydantic model to JSON string for history
-            import json
-            response_content_for_history = response_obj.model_dump_json()
-
-            self.swe_context._update_chat_history(
-                state['chat_history'],
-                state['question'],
-                response_content_for_history 
+                "file": section_plan.file,
+                "source": source,
+                "instruction": instruction,
+            }, SectionResponse, state['verbose'])
+            return strip_code_fences(response.content)
+
+        def rewrite_instruction(index: int, retry: bool = False) -> str:
+            section = sections[index]
+            instruction = (
+                f"Rewrite this section, {section['name']} (lines {section['start']}-{section['end']}):\n\n"
+                f"{section_source(source, section)}"
             )
+            if retry:
+                instruction += "\n\nA previous rewrite of this section did not parse when put back into the file."
+            return instruction
 
-            return {
-                **state,
-                "implementation": response_obj # Store the Pydantic object directly
-            }
-        except Exception as e:
-            print(f"Error in ImplementationNode: {e}")
-            # Fallback or error handling: store the error or an empty response
-            error_response = ImplementResponse(file="ERROR", content=f"Error: {e}", next_file_to_implement="None")
-            self.swe_context._update_chat_history(
-                 state['chat_history'],
-                 state['question'],
-                 error_response.model_dump_json()
-            )
-            return {
-                **state,
-                "implementation": error_response 
-            }
+        append_instruction = "Write the new top-level code to append at the end of the file."
+
+        def regenerate_all(indices: List[int], append: bool, retry: bool = False) -> Tuple[Dict[int, str], str]:
+            with ThreadPoolExecutor(max_workers=min(MAX_SECTION_WORKERS, len(indices) + 1)) as executor:
+                futures = {index: executor.submit(regenerate, rewrite_instruction(index, retry)) for index in indices}
+                appended = executor.submit(regenerate, append_instruction) if append else None
+                return {index: future.result() for index, future in futures.items()}, appended.result() if appended else ""
+
+        replacements, appended_code = regenerate_all(indices, section_plan.append_new_code)
+        try:
+            content = splice_sections(source, replacements, sections, appended_code)
+        except SpliceError as e:
+            # Regenerate only the sections that break the file, then give up on the sectional edit
+            bad = unsplicable_sections(source, replacements, sections)
+            bad_append = False
+            try:
+                splice_sections(source, {}, sections, appended_code)
+            except SpliceError:
+                bad_append = True
+            if bad or bad_append:
+                print(f"Warning: {e}; regenerating {len(bad) + bad_append} section(s) of {section_plan.file}")
+                retried, retried_append = regenerate_all(bad, bad_append, retry=True)
+                replacements.update(retried)
+                if bad_append:
+                    appended_code = retried_append
+            try:
+                content = splice_sections(source, replacements, sections, appended_code)
+            except SpliceError as e:
+                print(f"Warning: {e}; rewriting {section_plan.file} in full instead")
+                return None
+
+        return ImplementResponse(
+            file=section_plan.file,
+            content=content,
+            next_file_to_implement=section_plan.next_file_to_implement,
+        )
+
+    def __call__(self, state: GraphState) -> GraphState:
+        # Context and history are loaded here rather than kept in the graph state, so
+        # checkpoints stay small; files written in earlier iterations are picked up
+        chat_history = self.swe_context._load_chat_history()
+        formatted_history = "\n".join([f'{msg["role"].capitalize()}: {msg["content"]}' for msg in chat_history])
+        prompt_inputs = {
+            "goal": state['question'],
+            "plan": state['plan'],
+            "context": self.swe_context._get_context_content(state['verbose']),
+            "history": formatted_history if formatted_history else "<no messages>"
+        }
+
+        # Large files would be truncated by the completion limit, so they are edited section by section
+        response_obj = None
+        large_files = self._large_files(state)
+        if large_files:
+            response_obj = self._implement_sections(state, prompt_inputs, large_files)
+        if response_obj is None:
+            response_obj = self._implement_file(state, prompt_inputs)
+
+        # Normalize once, so the hash, size and diff in history describe exactly what is written
+        response_obj = response_obj.model_copy(update={"content": normalize_content(response_obj.content)})
+
+        return {
+            **state,
+            "implementation": response_obj # Store the Pydantic object directly
+        }
 
 
 class FileWriterNode:
     """Node for writing implementation to files."""
     def __init__(self, swe_context: SweContext):
         self.swe_context = swe_context
+        self.blob_store = BlobStore(swe_context.blob_dir)
+
+    @staticmethod
+    def _history_record(response_obj: ImplementResponse, digest: str) -> str:
+        """Summarize an implementation as path, content hash, size and diff stats."""
+        old_content = ""
+        if os.path.isfile(response_obj.file):
+            try:
+                with open(response_obj.file, "r") as f:
+                    old_content = f.read()
+            except (UnicodeDecodeError, OSError):
+                pass
+        added = removed = 0
+        for line in difflib.unified_diff(old_content.splitlines(), response_obj.content.splitlines(), lineterm=""):
+            if line.startswith("+") and not line.startswith("+++"):
+                added += 1
+            elif line.startswith("-") and not line.startswith("---"):
+                removed += 1
+        return json.dumps({
+            "file": response_obj.file,
+            "sha256": digest,
+            "size": len(response_obj.content.encode("utf-8")),
+            "diff": f"+{added} -{removed} lines",
+            "next_file_to_implement": response_obj.next_file_to_implement,
+        })
 
     def __call__(self, state: GraphState) -> GraphState:
         import os
         import shutil
         
-        implement_response = state['implementation']
-
-        # Check if implementation is the Pydantic model or needs parsing (fallback)
-        if not isinstance(implement_response, ImplementResponse):
-            # This is a fallback in case structured output failed and a string was returned
-            # Or if an error occurred and we have the error Pydantic model
-            print(f"Warning: FileWriterNode received a string, attempting to parse. Content: {implement_response}")
-            try:
-                # If it's an error string from a previous node that didn't produce a Pydantic object
-                if isinstance(implement_response, str) and implement_response.startswith("ERROR"):
-                     return {**state, "next_file": "None"} # Stop further processing
-
-                # Attempt to parse if it's a JSON string
-                implement_response_obj = ImplementResponse.model_validate_json(implement_response)
-            except Exception as e:
-                print(f"Error parsing implementation string in FileWriterNode: {e}")
-                # Decide how to handle: maybe stop, or try to extract info if possible
-                return {**state, "next_file": "None"} # Stop if parsing fails
-        else:
-            implement_response_obj = implement_response
-
-
-        if implement_response_obj.file == "ERROR": # Check for error sentinel
-            print(f"Skipping file writing due to previous error: {implement_response_obj.content}")
-            return {**state, "next_file": "None"}
-
+        implement_response_obj = state['implementation']
 
         file_path = implement_response_obj.file
         content = implement_response_obj.content
         next_file = implement_response_obj.next_file_to_implement
 
-        # Clean the content: remove markdown code fences
-        import re
-        # Regex to find markdown code blocks (e.g., ```python ... ``` or ``` ... ```)
-        # It captures the content within the fences.
-        match = re.search(r"^```(?:[a-zA-Z0-9_\-]+)?\n(.*?)\n^```$", content, re.DOTALL | re.MULTILINE)
-        if match:
-            content = match.group(1).strip() # Get the captured group and strip whitespace
-        else:
-            # Fallback for cases where only fences might be present without language spec or newline structure
-            content = re.sub(r"^```(?:[a-zA-Z0-9_\-]+)?\n?", "", content, flags=re.MULTILINE)
-            content = re.sub(r"\n?^```$", "", content, flags=re.MULTILINE).strip()
+        # Refuse to write Python that does not parse, e.g. because the completion was truncated
+        if file_path.endswith(".py") and content:
+            try:
+                ast.parse(content)
+            except SyntaxError as e:
+                print(f"Refusing to write {file_path}: generated content does not parse ({e})")
+                return {**state, "next_file": "None"}
 
         if file_path and content and file_path.lower() != "none":
             try:
@@ -186,8 +335,12 @@ class FileWriterNode:
                 if dir_name: # Ensure dirname is not empty (for files in root)
                     os.makedirs(dir_name, exist_ok=True)
                 
+                # Diff against the current file before it is replaced
+                digest = BlobStore.digest(content)
+                history_record = self._history_record(implement_response_obj, digest)
+
                 # Create backup
-                backup_dir = os.path.join(os.path.expanduser("~"), ".swe", "backup")
+                backup_dir = os.path.join(self.swe_context.swe_dir, "backup")
                 os.makedirs(backup_dir, exist_ok=True)
                 if os.path.exists(file_path):
                     shutil.copy(file_path, os.path.join(backup_dir, os.path.basename(file_path) + f".{os.times().user:.0f}.bak")) # Add timestamp to backup
@@ -200,6 +353,16 @@ class FileWriterNode:
                 with open(file_path, 'w') as f:
                     f.write(content)
                 print(f"Implemented changes in {file_path}")
+
+                # Only written files are recorded. The file body is already in context, so history
+                # keeps a compact record; the body goes to the blob store for on-demand expansion
+                self.blob_store.put(content)
+                self.swe_context._update_chat_history(
+                    self.swe_context._load_chat_history(),
+                    state['question'],
+                    history_record,
+                    blob=digest
+                )
                 
                 # Add implemented file to context for next iteration if needed
                 self.swe_context.add_file(file_path)
@@ -218,40 +381,42 @@ class FileWriterNode:
             # If no file_path, or content is empty, or file_path is "None" then we are done or there's an issue.
             return {**state, "next_file": "None"}
 
-def create_implementation_graph(swe_context: SweContext) -> Graph:
-    """Create the implementation graph."""
-    plan_node = PlanNode(swe_context)
-    context_node = ContextNode(swe_context)
-    implementation_node = ImplementationNode(swe_context)
+def create_implementation_graph(
+    swe_context: SweContext,
+    router: Optional[ModelRouter] = None,
+    checkpointer: Optional[BaseCheckpointSaver] = None,
+) -> Graph:
+    """Create the implementation graph. With a checkpointer, state is saved after every node."""
+    router = router or ModelRouter()
+    plan_node = PlanNode(swe_context, router)
+    implementation_node = ImplementationNode(swe_context, router)
     file_writer_node = FileWriterNode(swe_context)
 
     workflow = StateGraph(GraphState)
 
-    workflow.add_node("gather_context", context_node)
     workflow.add_node("generate_plan", plan_node)
     workflow.add_node("generate_implementation", implementation_node)
     workflow.add_node("write_file", file_writer_node)
     workflow.add_node("end", lambda x: x) 
 
-    workflow.add_edge("gather_context", "generate_plan")
     workflow.add_edge("generate_plan", "generate_implementation")
     workflow.add_edge("generate_implementation", "write_file")
     
     def should_continue(state: GraphState) -> str:
         next_file_val = state.get("next_file")
-        return "gather_context" if next_file_val and next_file_val.lower() != "none" else "end"
+        return "generate_plan" if next_file_val and next_file_val.lower() != "none" else "end"
     
     workflow.add_conditional_edges(
         "write_file",
         should_continue,
         {
-            "gather_context": "gather_context",
+            "generate_plan": "generate_plan",
             "end": "end"
         }
     )
 
-    workflow.set_entry_point("gather_context")
-    return workflow.compile()
+    workflow.set_entry_point("generate_plan")
+    return workflow.compile(checkpointer=checkpointer)
 
 
 def plot_graph(graph: Graph, output_path: str = "implementation_graph.png") -> None:
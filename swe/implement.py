@@ -1,39 +1,105 @@
 import json
 import os
-from typing import List, Dict
+import sqlite3
+import time
+import uuid
+from typing import List, Dict, Optional
+from langgraph.checkpoint.sqlite import SqliteSaver
 from swe.context import SweContext
 from swe.graph import create_implementation_graph, GraphState
+from swe.router import ModelRouter
 
 class SweImplement:
 
-    def __init__(self, swe_context: SweContext):
+    def __init__(self, swe_context: SweContext, router: Optional[ModelRouter] = None):
         self.swe_context = swe_context
-        self.graph = create_implementation_graph(swe_context)
-
-    def implement(self, question: str, verbose: bool = False) -> None:
-        initial_state: GraphState = {
-            "question": question,
-            "plan": "",
-            "context": "",
-            "chat_history": [],
-            "current_file": "",
-            "next_file": "",
-            "implementation": "",
-            "verbose": verbose,
-        }
+        self.checkpoint_path = os.path.join(swe_context.swe_dir, "checkpoints.sqlite")
+        self.runs_path = os.path.join(swe_context.swe_dir, "runs.json")
+        os.makedirs(swe_context.swe_dir, exist_ok=True)
+        self.checkpointer = SqliteSaver(sqlite3.connect(self.checkpoint_path, check_same_thread=False))
+        self.graph = create_implementation_graph(swe_context, router, self.checkpointer)
+
+    def _load_runs(self) -> Dict[str, Dict]:
+        if os.path.exists(self.runs_path):
+            try:
+                with open(self.runs_path, "r") as f:
+                    return json.load(f)
+            except (json.JSONDecodeError, IOError):
+                print("Warning: Could not read runs index.")
+        return {}
+
+    def _save_runs(self, runs: Dict[str, Dict]) -> None:
+        try:
+            with open(self.runs_path, "w") as f:
+                json.dump(runs, f, indent=4)
+        except IOError as e:
+            print(f"Error saving runs index: {e}")
+
+    def implement(self, question: Optional[str], verbose: bool = False, resume: Optional[str] = None) -> None:
+        runs = self._load_runs()
+        if resume:
+            if resume not in runs:
+                print(f"Run {resume} not found. Use 'swe runs' to list resumable runs.")
+                return
+            if runs[resume]["status"] == "completed":
+                print(f"Run {resume} already completed.")
+                return
+            run_id = resume
+            # Passing no input makes LangGraph continue from the last checkpoint
+            graph_input = None
+            print(f"Resuming run {run_id}: {runs[run_id]['question']}")
+        else:
+            run_id = uuid.uuid4().hex[:8]
+            graph_input: GraphState = {
+                "question": question,
+                "plan": "",
+                "current_file": "",
+                "next_file": "",
+                "implementation": None,
+                "verbose": verbose,
+            }
+            runs[run_id] = {"question": question, "started": time.time(), "status": "running"}
+            self._save_runs(runs)
+
+        config = {"configurable": {"thread_id": run_id}}
 
         if verbose:
             print("\n" + "=" * 80)
             print(" " * 30 + "STARTING GRAPH EXECUTION")
             print("=" * 80 + "\n")
-            print(f"Initial State: {initial_state}")
+            print(f"Run: {run_id}")
+            print(f"Initial State: {graph_input}")
 
-        final_state = self.graph.invoke(initial_state)
+        try:
+            final_state = self.graph.invoke(graph_input, config)
+        except KeyboardInterrupt:
+            print(f"\nRun {run_id} interrupted. Resume with: swe implement --resume {run_id}")
+            return
+        except Exception:
+            print(f"Run {run_id} failed. Resume with: swe implement --resume {run_id}")
+            raise
 
         if verbose:
             print("\n" + "=" * 80)
             print(" " * 30 + "GRAPH EXECUTION COMPLETE")
             print("=" * 80 + "\n")
             print(f"Final State: {final_state}")
-        
+
+        runs[run_id]["status"] = "completed"
+        self._save_runs(runs)
+        # Completed runs cannot be resumed, so their checkpoints are only dead weight
+        self.checkpointer.delete_thread(run_id)
         print("Implementation complete.")
+
+    def show_runs(self) -> None:
+        runs = {run_id: run for run_id, run in self._load_runs().items() if run["status"] != "completed"}
+        if not runs:
+            print("No resumable runs.")
+            return
+        for run_id, run in sorted(runs.items(), key=lambda item: item[1]["started"]):
+            snapshot = self.graph.get_state({"configurable": {"thread_id": run_id}})
+            next_node = ", ".join(snapshot.next) if snapshot.next else "start"
+            current_file = snapshot.values.get("current_file") or "-"
+            started = time.strftime("%Y-%m-%d %H:%M", time.localtime(run["started"]))
+            print(f"{run_id}  {started}  next: {next_node:<24} last file: {current_file}")
+            print(f"    {run['question']}")
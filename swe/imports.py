@@ -0,0 +1,138 @@
+import ast
+import json
+import os
+from typing import Dict, List, Optional, Set
+
+PROJECT_MARKERS = ["pyproject.toml", "setup.py", "setup.cfg", ".git"]
+
+
+class ImportGraph:
+    """Python import graph of a project, with parsed imports cached per file mtime."""
+
+    def __init__(self, root: Optional[str] = None, cache_path: Optional[str] = None):
+        self.root = os.path.abspath(root) if root else self.find_project_root(os.getcwd())
+        self.cache_path = cache_path or os.path.join(os.path.expanduser("~"), ".swe", "imports.json")
+        self._cache: Optional[Dict[str, Dict]] = None
+        self._dirty = False
+        # Also resolve against a src/ layout if the project uses one
+        self.search_roots = [self.root]
+        if os.path.isdir(os.path.join(self.root, "src")):
+            self.search_roots.append(os.path.join(self.root, "src"))
+
+    @staticmethod
+    def find_project_root(start: str) -> str:
+        current = os.path.abspath(start if os.path.isdir(start) else os.path.dirname(start))
+        while True:
+            if any(os.path.exists(os.path.join(current, marker)) for marker in PROJECT_MARKERS):
+                return current
+            parent = os.path.dirname(current)
+            if parent == current:
+                return os.path.abspath(start if os.path.isdir(start) else os.path.dirname(start))
+            current = parent
+
+    def _load_cache(self) -> Dict[str, Dict]:
+        if self._cache is None:
+            self._cache = {}
+            if os.path.exists(self.cache_path):
+                try:
+                    with open(self.cache_path, "r") as f:
+                        self._cache = json.load(f)
+                except (json.JSONDecodeError, IOError):
+                    print("Warning: Could not read import cache. Rebuilding it.")
+        return self._cache
+
+    def save_cache(self) -> None:
+        if not self._dirty:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            with open(self.cache_path, "w") as f:
+                json.dump(self._cache, f)
+            self._dirty = False
+        except IOError as e:
+            print(f"Error saving import cache: {e}")
+
+    def parse_imports(self, file_path: str) -> List[Dict]:
+        """Return the imports of a file as {"module", "names", "level"} entries."""
+        cache = self._load_cache()
+        try:
+            mtime = os.path.getmtime(file_path)
+        except OSError:
+            return []
+        cached = cache.get(file_path)
+        if cached is not None and cached["mtime"] == mtime:
+            return cached["imports"]
+
+        try:
+            with open(file_path, "r", encoding="utf-8") as f:
+                tree = ast.parse(f.read(), filename=file_path)
+        except (SyntaxError, UnicodeDecodeError, OSError):
+            tree = None
+
+        imports = []
+        for node in ast.walk(tree) if tree is not None else []:
+            if isinstance(node, ast.Import):
+                for alias in node.names:
+                    imports.append({"module": alias.name, "names": [], "level": 0})
+            elif isinstance(node, ast.ImportFrom):
+                imports.append({
+                    "module": node.module or "",
+                    "names": [alias.name for alias in node.names if alias.name != "*"],
+                    "level": node.level,
+                })
+        cache[file_path] = {"mtime": mtime, "imports": imports}
+        self._dirty = True
+        return imports
+
+    def _resolve_module(self, base_dirs: List[str], module: str) -> Optional[str]:
+        parts = module.split(".") if module else []
+        for base_dir in base_dirs:
+            module_path = os.path.join(base_dir, *parts)
+            if parts and os.path.isfile(module_path + ".py"):
+                return module_path + ".py"
+            if os.path.isfile(os.path.join(module_path, "__init__.py")):
+                return os.path.join(module_path, "__init__.py")
+        return None
+
+    def resolve_imports(self, file_path: str) -> List[str]:
+        """Return the project files imported by a file. Imports outside the project are skipped."""
+        resolved = []
+        for entry in self.parse_imports(file_path):
+            if entry["level"]:
+                base_dir = os.path.dirname(file_path)
+                for _ in range(entry["level"] - 1):
+                    base_dir = os.path.dirname(base_dir)
+                base_dirs = [base_dir]
+            else:
+                base_dirs = self.search_roots
+
+            target = self._resolve_module(base_dirs, entry["module"])
+            if target:
+                resolved.append(target)
+            # "from pkg import name" may import a submodule rather than an attribute
+            for name in entry["names"]:
+                submodule = f'{entry["module"]}.{name}' if entry["module"] else name
+                target = self._resolve_module(base_dirs, submodule)
+                if target:
+                    resolved.append(target)
+        return [path for path in dict.fromkeys(resolved) if path != file_path]
+
+    def dependencies(self, file_path: str, depth: Optional[int] = None) -> List[str]:
+        """Return the file and its transitive project imports, breadth-first, up to depth levels."""
+        start = os.path.abspath(file_path)
+        seen: Set[str] = {start}
+        ordered = [start]
+        frontier = [start]
+        level = 0
+        while frontier and (depth is None or level < depth):
+            next_frontier = []
+            for current in frontier:
+                for dependency in self.resolve_imports(current):
+                    if dependency not in seen:
+                        seen.add(dependency)
+                        ordered.append(dependency)
+                        next_frontier.append(dependency)
+            frontier = next_frontier
+            level += 1
+        self.save_cache()
+        return ordered
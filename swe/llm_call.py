@@ -0,0 +1,140 @@
+import queue
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple, TypeVar
+
+import openai
+from pydantic import BaseModel
+
+from swe.context import SweContext
+from swe.router import DEFAULT_TIMEOUT, ModelRouter
+
+T = TypeVar("T")
+
+DEFAULT_MAX_RETRIES = 2
+DEFAULT_BACKOFF = 1.0
+HEDGE_PERCENTILE = 95
+HEDGE_MIN_SAMPLES = 20
+
+
+class LLMCallError(Exception):
+    """Raised when an LLM call fails after all retries."""
+
+
+class LLMCaller:
+    """Shared wrapper for LLM calls with deadlines, jittered retries and hedged requests.
+
+    Per-route settings are read from the routing config:
+    - timeout: seconds before an attempt is abandoned (default 120, 600 for implement)
+    - max_retries: retries after the first attempt (default 2)
+    - hedge: fire a second request when the first is slower than the p95
+      latency recorded for the route (default false). The slower request is
+      abandoned but still billed.
+    - hedge_delay: fixed hedge delay in seconds, overriding the p95
+
+    Only timeouts, connection errors, rate limits and server errors are retried;
+    other errors (auth, bad requests, unparseable output) fail immediately.
+    Each attempt is recorded on the router with its prompt and completion tokens.
+    """
+
+    def __init__(self, router: ModelRouter, sleep: Callable[[float], None] = time.sleep):
+        self.router = router
+        self.sleep = sleep
+
+    def call(self, stage: str, route: Dict[str, Any], prompt_tokens: int, fn: Callable[[], T]) -> T:
+        timeout = route.get("timeout", DEFAULT_TIMEOUT)
+        max_retries = route.get("max_retries", DEFAULT_MAX_RETRIES)
+        hedge_delay = self._hedge_delay(stage, route)
+
+        for attempt in range(max_retries + 1):
+            start = time.perf_counter()
+            try:
+                result = self._attempt(fn, timeout, hedge_delay)
+                self.router.record(
+                    stage, route, prompt_tokens, time.perf_counter() - start,
+                    completion_tokens=self._completion_tokens(result),
+                )
+                return result
+            except Exception as e:
+                self.router.record(stage, route, prompt_tokens, time.perf_counter() - start, success=False)
+                if attempt == max_retries or not self._is_retryable(e):
+                    raise LLMCallError(
+                        f"{stage} call to {route['model']} failed after {attempt + 1} attempts: {e}"
+                    ) from e
+                # Full jitter: spread retries so concurrent callers don't hammer the API in lockstep
+                backoff = random.uniform(0, route.get("backoff", DEFAULT_BACKOFF) * 2 ** attempt)
+                print(f"Warning: {stage} call to {route['model']} failed ({e}), retrying in {backoff:.1f}s")
+                self.sleep(backoff)
+
+    @staticmethod
+    def _is_retryable(error: Exception) -> bool:
+        # APITimeoutError is a subclass of APIConnectionError
+        if isinstance(error, (TimeoutError, ConnectionError, openai.APIConnectionError, openai.RateLimitError)):
+            return True
+        return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+    @staticmethod
+    def _completion_tokens(result: Any) -> int:
+        """Output tokens from the response usage, or estimated from the output when it is not reported."""
+        usage = getattr(result, "usage_metadata", None)
+        if usage and usage.get("output_tokens") is not None:
+            return usage["output_tokens"]
+        # Structured output returns the parsed model, which carries no usage
+        if isinstance(result, BaseModel):
+            return SweContext._count_tokens(result.model_dump_json())
+        content = getattr(result, "content", result)
+        return SweContext._count_tokens(content if isinstance(content, str) else str(content))
+
+    def _hedge_delay(self, stage: str, route: Dict[str, Any]) -> Optional[float]:
+        if not route.get("hedge"):
+            return None
+        if route.get("hedge_delay") is not None:
+            return route["hedge_delay"]
+        return self.router.latency_percentile(stage, route["model"], HEDGE_PERCENTILE, HEDGE_MIN_SAMPLES)
+
+    @staticmethod
+    def _attempt(fn: Callable[[], T], timeout: float, hedge_delay: Optional[float]) -> T:
+        results: "queue.Queue[Tuple[bool, Any]]" = queue.Queue()
+
+        def run() -> None:
+            try:
+                results.put((True, fn()))
+            except Exception as e:
+                results.put((False, e))
+
+        def start() -> None:
+            # Daemon threads, so an abandoned request never keeps the process alive at exit.
+            # The client's own request timeout ends the underlying HTTP call.
+            threading.Thread(target=run, daemon=True).start()
+
+        deadline = time.monotonic() + timeout
+        start()
+        pending = 1
+        if hedge_delay is not None and hedge_delay < timeout:
+            try:
+                ok, value = results.get(timeout=hedge_delay)
+                if ok:
+                    return value
+                raise value
+            except queue.Empty:
+                start()
+                pending += 1
+
+        last_error: Optional[BaseException] = None
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                ok, value = results.get(timeout=remaining)
+            except queue.Empty:
+                break
+            pending -= 1
+            if ok:
+                return value
+            last_error = value
+
+        if pending:
+            raise TimeoutError(f"no response within {timeout:g}s")
+        raise last_error
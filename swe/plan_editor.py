@@ -1,10 +1,12 @@
 import os
+from typing import Optional
 
 
 class PlanEditor:
 
-    def __init__(self):
-        self.file_path = os.path.join(os.path.expanduser('~'), '.swe', 'planner.txt')
+    def __init__(self, swe_dir: Optional[str] = None):
+        swe_dir = swe_dir or os.path.join(os.path.expanduser('~'), '.swe')
+        self.file_path = os.path.join(swe_dir, 'planner.txt')
         os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
 
     def set_content(self, content: str) -> None:
@@ -0,0 +1,187 @@
+import json
+import os
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from langchain_openai import ChatOpenAI
+
+# Each stage maps to an ordered list of routes. The first route whose
+# max_prompt_tokens is unset or not exceeded by the prompt is used.
+DEFAULT_ROUTES: Dict[str, List[Dict[str, Any]]] = {
+    "ask": [{"model": "gpt-4o-mini"}],
+    "plan": [{"model": "gpt-4o-mini"}],
+    "implement": [{"model": "gpt-4o"}],
+}
+
+# Context window sizes (in tokens) of known models. Routes can override
+# this with a "context_window" key.
+MODEL_CONTEXT_WINDOWS: Dict[str, int] = {
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+    "gpt-4-turbo": 128000,
+    "gpt-4.1": 1047576,
+    "gpt-4.1-mini": 1047576,
+    "gpt-4.1-nano": 1047576,
+    "o1": 200000,
+    "o3": 200000,
+    "o3-mini": 200000,
+    "o4-mini": 200000,
+}
+DEFAULT_CONTEXT_WINDOW = 128000
+
+# Seconds before an LLM request is abandoned, unless the route sets "timeout".
+# Implement completions return whole files, so they get longer than answers.
+DEFAULT_TIMEOUT = 120.0
+STAGE_TIMEOUTS: Dict[str, float] = {
+    "implement": 600.0,
+}
+
+
+def default_llm_factory(route: Dict[str, Any]) -> Any:
+    """Build a chat client for a route."""
+    # Retries are owned by LLMCaller, so the client must not retry on its own. The
+    # route timeout is passed through so a timed-out HTTP request is actually cancelled.
+    kwargs = {
+        "model": route["model"],
+        "temperature": route.get("temperature", 0),
+        "max_retries": 0,
+        "timeout": route.get("timeout", DEFAULT_TIMEOUT),
+    }
+    if route.get("base_url"):
+        kwargs["base_url"] = route["base_url"]
+    return ChatOpenAI(**kwargs)
+
+
+class ModelRouter:
+    """Picks a model and client per LLM call based on stage and prompt size."""
+
+    def __init__(
+        self,
+        swe_dir: Optional[str] = None,
+        llm_factory: Optional[Callable[[Dict[str, Any]], Any]] = None,
+    ):
+        self.swe_dir = swe_dir or os.path.join(os.path.expanduser("~"), ".swe")
+        self.config_path = os.path.join(self.swe_dir, "models.json")
+        self.log_path = os.path.join(self.swe_dir, "routes.jsonl")
+        self.llm_factory = llm_factory or default_llm_factory
+        self.routes = self._load_routes()
+        self._clients: Dict[str, Any] = {}
+        self._records: Optional[List[Dict[str, Any]]] = None
+
+    def _load_routes(self) -> Dict[str, List[Dict[str, Any]]]:
+        routes = {stage: list(stage_routes) for stage, stage_routes in DEFAULT_ROUTES.items()}
+        if os.path.exists(self.config_path):
+            try:
+                with open(self.config_path, "r") as f:
+                    routes.update(json.load(f))
+            except (json.JSONDecodeError, IOError) as e:
+                print(f"Warning: Could not read model routing config, using defaults: {e}")
+        return routes
+
+    def select(self, stage: str, prompt_tokens: int) -> Dict[str, Any]:
+        """Return the first route of the stage that accepts a prompt of this size.
+
+        Routes without a timeout get the stage's default one.
+        """
+        stage_routes = self.routes.get(stage) or DEFAULT_ROUTES.get(stage) or DEFAULT_ROUTES["ask"]
+        # Prompt exceeds every threshold: fall back to the last (largest) route
+        route = stage_routes[-1]
+        for stage_route in stage_routes:
+            limit = stage_route.get("max_prompt_tokens")
+            if limit is None or prompt_tokens <= limit:
+                route = stage_route
+                break
+        return {"timeout": STAGE_TIMEOUTS.get(stage, DEFAULT_TIMEOUT), **route}
+
+    def context_window(self, stage: str = "ask") -> Tuple[str, int]:
+        """Return the model a full-context prompt of the stage is routed to, and its context window."""
+        route = self.select(stage, sys.maxsize)
+        window = route.get("context_window") or MODEL_CONTEXT_WINDOWS.get(route["model"], DEFAULT_CONTEXT_WINDOW)
+        return route["model"], window
+
+    def get_llm(self, route: Dict[str, Any]) -> Any:
+        """Return a cached client for the route."""
+        key = json.dumps(route, sort_keys=True)
+        if key not in self._clients:
+            self._clients[key] = self.llm_factory(route)
+        return self._clients[key]
+
+    def record(self, stage: str, route: Dict[str, Any], prompt_tokens: int, latency: float, success: bool = True, completion_tokens: int = 0) -> None:
+        """Append a per-call routing record to the routes log."""
+        entry = {
+            "timestamp": time.time(),
+            "stage": stage,
+            "model": route["model"],
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "latency": round(latency, 4),
+            "success": success,
+        }
+        prompt_cost = route.get("cost_per_1k_prompt_tokens")
+        completion_cost = route.get("cost_per_1k_completion_tokens")
+        if prompt_cost is not None or completion_cost is not None:
+            entry["cost"] = (prompt_tokens * (prompt_cost or 0) + completion_tokens * (completion_cost or 0)) / 1000
+        if self._records is not None:
+            self._records.append(entry)
+        try:
+            os.makedirs(self.swe_dir, exist_ok=True)
+            with open(self.log_path, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+        except IOError as e:
+            print(f"Error saving routing record: {e}")
+
+    def load_records(self) -> List[Dict[str, Any]]:
+        if self._records is not None:
+            return self._records
+        records = []
+        if os.path.exists(self.log_path):
+            with open(self.log_path, "r") as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        continue
+        self._records = records
+        return records
+
+    def latency_percentile(self, stage: str, model: str, percentile: float, min_samples: int = 1) -> Optional[float]:
+        """Return the latency percentile of successful calls, or None with too few samples."""
+        latencies = sorted(
+            record["latency"] for record in self.load_records()
+            if record.get("stage") == stage and record.get("model") == model and record.get("success", True)
+        )
+        if not latencies or len(latencies) < min_samples:
+            return None
+        index = min(len(latencies) - 1, int(round(percentile / 100 * (len(latencies) - 1))))
+        return latencies[index]
+
+    def summarize(self) -> Dict[str, Dict[str, Any]]:
+        """Aggregate recorded calls per stage and model."""
+        summary: Dict[str, Dict[str, Any]] = {}
+        for record in self.load_records():
+            key = f'{record["stage"]}:{record["model"]}'
+            stats = summary.setdefault(key, {
+                "calls": 0, "failures": 0, "prompt_tokens": 0, "completion_tokens": 0, "latency": 0.0, "cost": 0.0,
+            })
+            stats["calls"] += 1
+            stats["failures"] += 0 if record.get("success", True) else 1
+            stats["prompt_tokens"] += record.get("prompt_tokens", 0)
+            stats["completion_tokens"] += record.get("completion_tokens", 0)
+            stats["latency"] += record.get("latency", 0.0)
+            stats["cost"] += record.get("cost", 0.0)
+        for stats in summary.values():
+            stats["avg_latency"] = stats["latency"] / stats["calls"]
+        return summary
+
+    def show_summary(self) -> None:
+        summary = self.summarize()
+        if not summary:
+            print("No routed calls recorded yet.")
+            return
+        print(f"{'ROUTE':<32}{'CALLS':>8}{'FAILED':>8}{'AVG LAT (s)':>13}{'PROMPT TOK':>12}{'OUTPUT TOK':>12}{'COST':>10}")
+        for key, stats in sorted(summary.items()):
+            print(
+                f"{key:<32}{stats['calls']:>8}{stats['failures']:>8}{stats['avg_latency']:>13.2f}"
+                f"{stats['prompt_tokens']:>12}{stats['completion_tokens']:>12}{stats['cost']:>10.4f}"
+            )
@@ -0,0 +1,106 @@
+import ast
+from typing import Dict, List, TypedDict
+
+# Files above this many tokens are edited section by section, so no single
+# completion has to hold the whole file.
+LARGE_FILE_TOKENS = 8000
+
+
+class Section(TypedDict):
+    """A contiguous, AST-delimited block of a file. Lines are 1-based and inclusive."""
+    name: str
+    start: int
+    end: int
+
+
+class SpliceError(ValueError):
+    """Raised when regenerated sections do not splice back into valid Python."""
+
+
+def _start_line(node: ast.stmt) -> int:
+    # Decorators belong to the function or class they decorate
+    decorators = getattr(node, "decorator_list", [])
+    return min([node.lineno] + [decorator.lineno for decorator in decorators])
+
+
+def _split_body(body: List[ast.stmt], prefix: str, max_lines: int) -> List[Section]:
+    sections: List[Section] = []
+    pending: List[ast.stmt] = []
+
+    def flush() -> None:
+        if pending:
+            start, end = _start_line(pending[0]), pending[-1].end_lineno
+            sections.append({"name": f"{prefix}code (lines {start}-{end})", "start": start, "end": end})
+            pending.clear()
+
+    for node in body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            flush()
+            start, end = _start_line(node), node.end_lineno
+            kind = "class" if isinstance(node, ast.ClassDef) else "def"
+            if isinstance(node, ast.ClassDef) and end - start + 1 > max_lines and node.body:
+                # Split oversized classes into a header and their members
+                header_end = _start_line(node.body[0]) - 1
+                if header_end >= start:
+                    sections.append({"name": f"{prefix}class {node.name} header", "start": start, "end": header_end})
+                sections.extend(_split_body(node.body, f"{prefix}{node.name}.", max_lines))
+            else:
+                sections.append({"name": f"{prefix}{kind} {node.name}", "start": start, "end": end})
+        else:
+            pending.append(node)
+    flush()
+    return sections
+
+
+def split_sections(source: str, max_lines: int = 300) -> List[Section]:
+    """Split Python source into top-level functions, classes and runs of other statements.
+
+    Classes longer than max_lines are split further into their members.
+    """
+    return _split_body(ast.parse(source).body, "", max_lines)
+
+
+def outline(sections: List[Section]) -> str:
+    return "\n".join(
+        f'[{index}] {section["name"]} (lines {section["start"]}-{section["end"]})'
+        for index, section in enumerate(sections)
+    )
+
+
+def section_source(source: str, section: Section) -> str:
+    lines = source.splitlines(keepends=True)
+    return "".join(lines[section["start"] - 1:section["end"]])
+
+
+def splice_sections(source: str, replacements: Dict[int, str], sections: List[Section], appended: str = "") -> str:
+    """Replace the given sections (by index) and append new code, keeping everything else intact.
+
+    Raises SpliceError if the result is not valid Python.
+    """
+    lines = source.splitlines(keepends=True)
+    # Replace from the bottom up so earlier line numbers stay valid
+    for index in sorted(replacements, key=lambda i: sections[i]["start"], reverse=True):
+        section = sections[index]
+        new_lines = replacements[index].rstrip("\n").splitlines(keepends=True)
+        if new_lines:
+            new_lines[-1] += "\n"
+        lines[section["start"] - 1:section["end"]] = new_lines
+    result = "".join(lines)
+    if appended.strip():
+        result = result.rstrip("\n") + "\n\n\n" + appended.strip("\n") + "\n"
+    try:
+        ast.parse(result)
+    except SyntaxError as e:
+        raise SpliceError(f"Spliced file does not parse: {e}") from e
+    return result
+
+
+def unsplicable_sections(source: str, replacements: Dict[int, str], sections: List[Section]) -> List[int]:
+    """Return the indices of replacements that do not parse when spliced in on their own."""
+    bad = []
+    for index, replacement in replacements.items():
+        try:
+            splice_sections(source, {index: replacement}, sections)
+        except SpliceError:
+            bad.append(index)
+    return bad
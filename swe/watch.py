@@ -0,0 +1,106 @@
+import os
+import time
+from typing import Dict, List, Tuple
+
+from swe.context import SweContext
+from swe.imports import ImportGraph
+from swe.paths import PathHandler
+
+Snapshot = Dict[str, Tuple[float, int]]
+
+
+class ContextWatcher:
+    """Polls the files and directories in context and keeps context and caches up to date.
+
+    New files in directories added with 'swe add dir/' join the context, deleted
+    files leave it, and token counts and parsed imports of changed files are
+    recomputed, so the next command starts with everything precomputed.
+    Bursts of changes (e.g. 'git checkout') are applied once the tree has been
+    stable for the debounce interval.
+    """
+
+    def __init__(self, swe_context: SweContext, model: str = 'gpt-4o', interval: float = 1.0, debounce: float = 0.5):
+        self.swe_context = swe_context
+        self.model = model
+        self.interval = interval
+        self.debounce = debounce
+        self.import_graph = ImportGraph(cache_path=os.path.join(swe_context.swe_dir, "imports.json"))
+
+    def snapshot(self) -> Snapshot:
+        """Return (mtime, size) for every context file and every non-ignored file in watched directories."""
+        data = self.swe_context._load_context()
+        if data is None:
+            return {}
+        ignore_patterns = self.swe_context._load_ignore_patterns()
+        paths = set(data["context"])
+        for directory in data.get("directories", []):
+            for root, dirs, files in os.walk(directory):
+                # Prune ignored directories instead of walking into them
+                dirs[:] = [d for d in dirs if not self.swe_context._should_ignore(os.path.join(root, d), ignore_patterns)]
+                for file in files:
+                    file_path = os.path.join(root, file)
+                    if not self.swe_context._should_ignore(file_path, ignore_patterns):
+                        paths.add(file_path)
+
+        snapshot = {}
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            snapshot[path] = (stat.st_mtime, stat.st_size)
+        return snapshot
+
+    def apply(self, previous: Snapshot, current: Snapshot) -> Tuple[List[str], List[str], List[str]]:
+        """Update the context list and caches for the changes between two snapshots."""
+        added = [path for path in current if path not in previous]
+        removed = [path for path in previous if path not in current]
+        modified = [path for path in current if path in previous and current[path] != previous[path]]
+
+        data = self.swe_context._load_context()
+        if data is not None and (added or removed):
+            in_context = set(data["context"])
+            new_files = [path for path in added if path not in in_context and self.swe_context._is_readable_file(path)]
+            removed_files = set(removed)
+            data["context"] = [path for path in data["context"] if path not in removed_files] + new_files
+            self.swe_context._save_context(data)
+
+        self.refresh(added + modified)
+        return added, removed, modified
+
+    def refresh(self, paths: List[str]) -> None:
+        """Recompute token counts for context files and parsed imports of the given Python files."""
+        # Only files whose mtime or size changed are re-tokenized
+        self.swe_context._get_file_stats(self.model)
+        for path in paths:
+            if path.endswith(".py"):
+                self.import_graph.parse_imports(path)
+        self.import_graph.save_cache()
+
+    def watch(self) -> None:
+        print("👀 Watching context for changes. Press Ctrl-C to stop.")
+        current = self.snapshot()
+        self.refresh(list(current))
+        try:
+            while True:
+                time.sleep(self.interval)
+                latest = self.snapshot()
+                if latest == current:
+                    continue
+                # Debounce: wait until the tree stops changing before applying
+                while True:
+                    time.sleep(self.debounce)
+                    settled = self.snapshot()
+                    if settled == latest:
+                        break
+                    latest = settled
+                added, removed, modified = self.apply(current, latest)
+                current = latest
+                for path in added:
+                    print(f"    +  {PathHandler.get_path_to_display(path)}")
+                for path in removed:
+                    print(f"    -  {PathHandler.get_path_to_display(path)}")
+                for path in modified:
+                    print(f"    ~  {PathHandler.get_path_to_display(path)}")
+        except KeyboardInterrupt:
+            print("\nStopped watching.")
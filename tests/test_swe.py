@@ -1,12 +1,590 @@
+import ast
+import hashlib
+import json
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 import unittest
+from unittest import mock
+import httpx
+import openai
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.runnables import RunnableLambda
+from swe.ask import SweAsk
+from swe.blobs import BlobStore
 from swe.context import SweContext
+from swe.graph import FileWriterNode, ImplementationNode, ImplementResponse, SectionPlan, SectionResponse
+from swe.implement import SweImplement
+from swe.imports import ImportGraph
+from swe.llm_call import LLMCallError, LLMCaller
+from swe.router import DEFAULT_TIMEOUT, STAGE_TIMEOUTS, ModelRouter, default_llm_factory
+from swe.sections import SpliceError, splice_sections, split_sections
+from swe.watch import ContextWatcher
 import os
 
+def fake_encoding():
+    # tiktoken downloads encodings on first use, so tests stub it out
+    encoding = mock.Mock()
+    encoding.name = "o200k_base"
+    return encoding
+
+class SweDirTestCase(unittest.TestCase):
+    """Runs against a temporary .swe directory, with tokens counted as whitespace-separated words."""
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_path = tmp_dir.name
+        self.swe_dir = os.path.join(self.tmp_path, ".swe")
+        self.swe_context = SweContext(self.swe_dir)
+        # Anything still writing to ~/.swe lands in a temporary home instead of the developer's
+        self.home = os.path.join(self.tmp_path, "home")
+        patches = [
+            mock.patch.dict(os.environ, {"HOME": self.home}),
+            mock.patch.object(SweContext, "_get_encoding", return_value=fake_encoding()),
+            mock.patch.object(SweContext, "_count_tokens", side_effect=lambda text, model='gpt-4o': len(text.split())),
+        ]
+        self.count_tokens = [patch.start() for patch in patches][-1]
+        for patch in patches:
+            self.addCleanup(patch.stop)
+
 class TestSweContext(unittest.TestCase):
     def test_init(self):
         swe_context = SweContext()
         swe_context.init()
         self.assertTrue(os.path.exists(swe_context.swe_dir))
 
+class TestModelRouter(SweDirTestCase):
+    def setUp(self):
+        super().setUp()
+        with open(os.path.join(self.swe_dir, "models.json"), "w") as f:
+            json.dump({
+                "ask": [
+                    {"model": "small", "max_prompt_tokens": 1000,
+                     "cost_per_1k_prompt_tokens": 0.5, "cost_per_1k_completion_tokens": 2.0},
+                    {"model": "large"},
+                ],
+            }, f)
+        self.built = []
+
+        def factory(route):
+            self.built.append(route["model"])
+            return FakeListChatModel(responses=[f"answer from {route['model']}"])
+
+        self.router = ModelRouter(swe_dir=self.swe_dir, llm_factory=factory)
+
+    def test_select_by_prompt_tokens(self):
+        self.assertEqual(self.router.select("ask", 10)["model"], "small")
+        self.assertEqual(self.router.select("ask", 5000)["model"], "large")
+        # Stages missing from the config keep their defaults
+        self.assertEqual(self.router.select("implement", 10)["model"], "gpt-4o")
+        self.assertEqual(self.router.select("implement", 10)["timeout"], STAGE_TIMEOUTS["implement"])
+        self.assertEqual(self.router.select("ask", 10)["timeout"], DEFAULT_TIMEOUT)
+
+    def test_clients_are_cached_per_route(self):
+        route = self.router.select("ask", 10)
+        self.assertIs(self.router.get_llm(route), self.router.get_llm(route))
+        self.assertEqual(self.built, ["small"])
+
+    def test_ask_records_route(self):
+        swe_ask = SweAsk(self.swe_context, self.router)
+        self.assertEqual(swe_ask.ask("hello"), "answer from small")
+        self.assertEqual(len(self.swe_context._load_chat_history()), 2)
+        records = self.router.load_records()
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]["stage"], "ask")
+        self.assertEqual(records[0]["model"], "small")
+        # The fake model reports no usage, so output tokens are estimated from the answer
+        self.assertEqual(records[0]["completion_tokens"], 3)
+        prompt_tokens = records[0]["prompt_tokens"]
+        self.assertAlmostEqual(records[0]["cost"], (prompt_tokens * 0.5 + 3 * 2.0) / 1000)
+        self.assertEqual(self.router.summarize()["ask:small"]["completion_tokens"], 3)
+
+class TestLLMCaller(SweDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.router = ModelRouter(swe_dir=self.swe_dir)
+        self.caller = LLMCaller(self.router, sleep=lambda _: None)
+
+    def test_retries_transient_errors(self):
+        calls = []
+
+        def flaky():
+            calls.append(1)
+            if len(calls) < 3:
+                raise ConnectionError("transient")
+            return "ok"
+
+        self.assertEqual(self.caller.call("ask", {"model": "m", "max_retries": 2}, 10, flaky), "ok")
+        self.assertEqual([r["success"] for r in self.router.load_records()], [False, False, True])
+
+    def test_does_not_retry_permanent_errors(self):
+        request = httpx.Request("POST", "https://api.example.com")
+        for error, calls_expected in [
+            (openai.BadRequestError("context length exceeded", response=httpx.Response(400, request=request), body=None), 1),
+            (ValueError("unparseable output"), 1),
+            (openai.RateLimitError("slow down", response=httpx.Response(429, request=request), body=None), 3),
+            (openai.InternalServerError("oops", response=httpx.Response(503, request=request), body=None), 3),
+        ]:
+            calls = []
+
+            def failing():
+                calls.append(1)
+                raise error
+
+            with self.assertRaises(LLMCallError):
+                self.caller.call("ask", {"model": "m", "max_retries": 2}, 10, failing)
+            self.assertEqual(len(calls), calls_expected, error)
+
+    def test_raises_after_retries_exhausted(self):
+        def failing():
+            raise ConnectionError("down")
+
+        with self.assertRaises(LLMCallError):
+            self.caller.call("ask", {"model": "m", "max_retries": 1}, 10, failing)
+
+    def test_timeout(self):
+        release = threading.Event()
+        with self.assertRaisesRegex(LLMCallError, "within 0.05s"):
+            self.caller.call("ask", {"model": "m", "max_retries": 0, "timeout": 0.05}, 10, release.wait)
+        release.set()
+
+    def test_abandoned_call_does_not_delay_exit(self):
+        script = (
+            "import time\n"
+            "from swe.llm_call import LLMCaller, LLMCallError\n"
+            "from swe.router import ModelRouter\n"
+            f"caller = LLMCaller(ModelRouter(swe_dir={self.swe_dir!r}))\n"
+            "try:\n"
+            "    caller.call('ask', {'model': 'm', 'max_retries': 0, 'timeout': 0.2}, 10, lambda: time.sleep(10))\n"
+            "except LLMCallError:\n"
+            "    pass\n"
+        )
+        start = time.monotonic()
+        subprocess.run([sys.executable, "-c", script], check=True, cwd=os.path.dirname(os.path.dirname(__file__)))
+        self.assertLess(time.monotonic() - start, 8)
+
+    def test_client_gets_route_timeout(self):
+        with mock.patch("swe.router.ChatOpenAI") as chat_openai:
+            default_llm_factory({"model": "m", "timeout": 30})
+            default_llm_factory({"model": "m"})
+        self.assertEqual(chat_openai.call_args_list[0].kwargs["timeout"], 30)
+        self.assertEqual(chat_openai.call_args_list[1].kwargs["timeout"], DEFAULT_TIMEOUT)
+        self.assertEqual(chat_openai.call_args_list[0].kwargs["max_retries"], 0)
+
+    def test_hedged_request_wins_over_stuck_call(self):
+        release = threading.Event()
+        calls = []
+
+        def first_call_stuck():
+            calls.append(1)
+            if len(calls) == 1:
+                release.wait()
+                return "slow"
+            return "fast"
+
+        route = {"model": "m", "max_retries": 0, "timeout": 5, "hedge": True, "hedge_delay": 0.05}
+        start = time.monotonic()
+        self.assertEqual(self.caller.call("ask", route, 10, first_call_stuck), "fast")
+        self.assertLess(time.monotonic() - start, 1)
+        release.set()
+
+    def test_hedge_delay_uses_recorded_p95(self):
+        for latency in range(1, 21):
+            self.router.record("ask", {"model": "m"}, 10, latency)
+        self.assertEqual(self.caller._hedge_delay("ask", {"model": "m", "hedge": True}), 19)
+        self.assertIsNone(self.caller._hedge_delay("ask", {"model": "m"}))
+
+class TestImportGraph(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = self.tmp_dir.name
+        files = {
+            "pyproject.toml": "",
+            "app.py": "import os\nfrom pkg import helpers\nimport pkg.models\n",
+            "pkg/__init__.py": "",
+            "pkg/helpers.py": "from .util import slugify\n",
+            "pkg/models.py": "",
+            "pkg/util.py": "from . import deep\n",
+            "pkg/deep.py": "",
+        }
+        for name, content in files.items():
+            path = os.path.join(self.root, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                f.write(content)
+        self.cache_path = os.path.join(self.root, "cache", "imports.json")
+        self.graph = ImportGraph(root=self.root, cache_path=self.cache_path)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _rel(self, paths):
+        return [os.path.relpath(path, self.root) for path in paths]
+
+    def test_dependencies_up_to_depth(self):
+        app = os.path.join(self.root, "app.py")
+        self.assertEqual(
+            self._rel(self.graph.dependencies(app, depth=1)),
+            ["app.py", "pkg/__init__.py", "pkg/helpers.py", "pkg/models.py"],
+        )
+        self.assertEqual(
+            self._rel(self.graph.dependencies(app)),
+            ["app.py", "pkg/__init__.py", "pkg/helpers.py", "pkg/models.py", "pkg/util.py", "pkg/deep.py"],
+        )
+
+    def test_parsed_imports_are_cached_by_mtime(self):
+        app = os.path.join(self.root, "app.py")
+        self.graph.dependencies(app, depth=1)
+        with open(self.cache_path, "r") as f:
+            self.assertIn(app, json.load(f))
+
+        reloaded = ImportGraph(root=self.root, cache_path=self.cache_path)
+        with mock.patch("swe.imports.ast.parse") as parse:
+            reloaded.parse_imports(app)
+            parse.assert_not_called()
+
+        os.utime(app, (0, 0))
+        with mock.patch("swe.imports.ast.parse", wraps=ast.parse) as parse:
+            reloaded.parse_imports(app)
+            parse.assert_called_once()
+
+class TestImplementationHistory(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_blob_store_roundtrip(self):
+        blob_store = BlobStore(os.path.join(self.tmp_dir.name, "blobs"))
+        digest = blob_store.put("print('hi')\n")
+        self.assertEqual(digest, BlobStore.digest("print('hi')\n"))
+        self.assertEqual(blob_store.get(digest), "print('hi')\n")
+        self.assertIsNone(blob_store.get("0" * 64))
+
+    def test_history_record_excludes_body(self):
+        path = os.path.join(self.tmp_dir.name, "module.py")
+        with open(path, "w") as f:
+            f.write("a = 1\nb = 2\n")
+        content = "a = 1\nb = 3\nc = 4\n" + "# filler\n" * 1000
+        response = ImplementResponse(file=path, content=content, next_file_to_implement="None")
+        record = json.loads(FileWriterNode._history_record(response, "abc"))
+        self.assertEqual(record["file"], path)
+        self.assertEqual(record["sha256"], "abc")
+        self.assertEqual(record["size"], len(content))
+        self.assertEqual(record["diff"], "+1002 -1 lines")
+        self.assertNotIn("filler", json.dumps(record))
+
+class FakeStructuredModel:
+    """Stands in for a chat model used with with_structured_output."""
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def with_structured_output(self, schema):
+        def respond(_):
+            self.calls += 1
+            response = self.responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+        return RunnableLambda(respond)
+
+class TestResumableImplement(SweDirTestCase):
+    def setUp(self):
+        super().setUp()
+        with open(os.path.join(self.swe_dir, "models.json"), "w") as f:
+            json.dump({
+                "plan": [{"model": "fake-plan"}],
+                "implement": [{"model": "fake-implement", "max_retries": 0}],
+            }, f)
+
+    def test_resume_skips_finished_files(self):
+        first = os.path.join(self.tmp_path, "first.py")
+        second = os.path.join(self.tmp_path, "second.py")
+        plan_model = FakeListChatModel(responses=["the plan"])
+        implement_model = FakeStructuredModel([
+            ImplementResponse(file=first, content="a = 1\n", next_file_to_implement=second),
+            ConnectionError("API outage"),
+            ImplementResponse(file=second, content="b = 2\n", next_file_to_implement="None"),
+        ])
+        models = {"fake-plan": plan_model, "fake-implement": implement_model}
+        router = ModelRouter(swe_dir=self.swe_dir, llm_factory=lambda route: models[route["model"]])
+
+        def plan_calls():
+            return len([record for record in router.load_records() if record["stage"] == "plan"])
+
+        swe_implement = SweImplement(self.swe_context, router)
+        with self.assertRaises(LLMCallError):
+            swe_implement.implement("write two files")
+        self.assertTrue(os.path.exists(first))
+        self.assertEqual(plan_calls(), 2)
+
+        run_id, run = next(iter(swe_implement._load_runs().items()))
+        self.assertEqual(run["status"], "running")
+        config = {"configurable": {"thread_id": run_id}}
+        # The context is recomputed on every iteration, so checkpoints do not carry it
+        checkpoints = list(swe_implement.checkpointer.list(config))
+        self.assertTrue(checkpoints)
+        self.assertFalse(any("context" in c.checkpoint["channel_values"] for c in checkpoints))
+
+        # A fresh instance resumes from the checkpoint without replanning or redoing the first file
+        SweImplement(self.swe_context, router).implement(None, resume=run_id)
+        self.assertEqual(plan_calls(), 2)
+        self.assertEqual(implement_model.calls, 3)
+        with open(second) as f:
+            self.assertEqual(f.read(), "b = 2\n")
+        self.assertEqual(swe_implement._load_runs()[run_id]["status"], "completed")
+        self.assertIsNone(swe_implement.checkpointer.get_tuple(config))
+        # Backups, the plan and file bodies all go to the configured directory
+        self.assertTrue(os.listdir(os.path.join(self.swe_dir, "backup")))
+        self.assertTrue(os.path.exists(os.path.join(self.swe_dir, "planner.txt")))
+        self.assertTrue(os.listdir(self.swe_context.blob_dir))
+        self.assertFalse(os.path.exists(self.home))
+
+    def test_history_hash_matches_written_file(self):
+        path = os.path.join(self.tmp_path, "module.py")
+        implement_model = FakeStructuredModel([
+            ImplementResponse(file=path, content="```python\na = 1\n```\n\n", next_file_to_implement="None"),
+        ])
+        router = ModelRouter(swe_dir=self.swe_dir, llm_factory=lambda route: implement_model)
+        state = {"question": "write a module", "plan": "the plan", "current_file": "", "next_file": "", "implementation": None, "verbose": False}
+
+        state = ImplementationNode(self.swe_context, router)(state)
+        FileWriterNode(self.swe_context)(state)
+
+        with open(path, "rb") as f:
+            written = f.read()
+        self.assertEqual(written, b"a = 1\n")
+        record = json.loads(self.swe_context._load_chat_history()[-1]["content"])
+        self.assertEqual(record["sha256"], hashlib.sha256(written).hexdigest())
+        self.assertEqual(record["size"], len(written))
+        self.assertEqual(BlobStore(self.swe_context.blob_dir).get(record["sha256"]), "a = 1\n")
+
+class TestContextStats(SweDirTestCase):
+    def setUp(self):
+        super().setUp()
+        files = {"pkg/a.py": "one two three", "pkg/sub/b.py": "one two", "c.py": "one"}
+        paths = []
+        for name, content in files.items():
+            path = os.path.join(self.tmp_path, "project", name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                f.write(content)
+            paths.append(path)
+        self.swe_context._save_context({"context": paths})
+
+    def test_stats_aggregate_directories(self):
+        stats = self.swe_context.get_context_stats("gpt-4o", 100)
+        self.assertEqual(stats["context_tokens"], 6)
+        self.assertEqual([os.path.basename(entry["path"]) for entry in stats["files"]], ["a.py", "b.py", "c.py"])
+        directories = {os.path.relpath(entry["path"], self.tmp_path): entry for entry in stats["directories"]
+                       if entry["path"].startswith(self.tmp_path)}
+        self.assertEqual(directories["project"]["tokens"], 6)
+        self.assertEqual(directories["project"]["files"], 3)
+        self.assertEqual(directories[os.path.join("project", "pkg")]["tokens"], 5)
+        self.assertEqual(directories[os.path.join("project", "pkg", "sub")]["tokens"], 2)
+
+    def test_token_counts_are_cached(self):
+        self.swe_context._get_file_stats()
+        self.assertEqual(self.count_tokens.call_count, 3)
+        self.swe_context._get_file_stats()
+        self.assertEqual(self.count_tokens.call_count, 3)
+
+        with open(os.path.join(self.tmp_path, "project", "c.py"), "w") as f:
+            f.write("one two three four")
+        stats = {os.path.basename(entry["path"]): entry["tokens"] for entry in self.swe_context._get_file_stats()}
+        self.assertEqual(self.count_tokens.call_count, 4)
+        self.assertEqual(stats["c.py"], 4)
+
+class TestContextWatcher(SweDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.project = os.path.join(self.tmp_path, "project")
+        os.makedirs(os.path.join(self.project, "__pycache__"))
+        with open(os.path.join(self.project, "a.py"), "w") as f:
+            f.write("import b\n")
+        self.swe_context.add_file(self.project)
+        self.watcher = ContextWatcher(self.swe_context)
+
+    def test_apply_tracks_new_and_deleted_files(self):
+        before = self.watcher.snapshot()
+        with open(os.path.join(self.project, "b.py"), "w") as f:
+            f.write("x = 1\n")
+        with open(os.path.join(self.project, "__pycache__", "b.cpython-311.pyc"), "w") as f:
+            f.write("ignored")
+        after = self.watcher.snapshot()
+        added, removed, modified = self.watcher.apply(before, after)
+        self.assertEqual([os.path.basename(path) for path in added], ["b.py"])
+        context = self.swe_context._load_context()["context"]
+        self.assertIn(os.path.join(self.project, "b.py"), context)
+
+        os.remove(os.path.join(self.project, "a.py"))
+        added, removed, modified = self.watcher.apply(after, self.watcher.snapshot())
+        self.assertEqual([os.path.basename(path) for path in removed], ["a.py"])
+        self.assertEqual(self.swe_context._load_context()["context"], [os.path.join(self.project, "b.py")])
+
+LARGE_MODULE = """import os
+
+
+@decorator
+def first():
+    return 1
+
+
+class Big:
+    \"\"\"Docstring.\"\"\"
+    attribute = 1
+
+    def method(self):
+        return 2
+
+    def other(self):
+        return 3
+
+
+CONSTANT = 4
+"""
+
+class TestSections(unittest.TestCase):
+    def test_split_sections(self):
+        names = [section["name"] for section in split_sections(LARGE_MODULE)]
+        self.assertEqual(names, ["code (lines 1-1)", "def first", "class Big", "code (lines 20-20)"])
+        # Decorators belong to their function
+        self.assertEqual(split_sections(LARGE_MODULE)[1]["start"], 4)
+
+    def test_split_oversized_class_into_members(self):
+        names = [section["name"] for section in split_sections(LARGE_MODULE, max_lines=5)]
+        self.assertEqual(names, [
+            "code (lines 1-1)", "def first", "class Big header", "Big.code (lines 10-11)",
+            "Big.def method", "Big.def other", "code (lines 20-20)",
+        ])
+
+    def test_splice_sections(self):
+        sections = split_sections(LARGE_MODULE, max_lines=5)
+        result = splice_sections(LARGE_MODULE, {4: "    def method(self):\n        return 20"}, sections, "def last():\n    pass")
+        self.assertIn("        return 20\n", result)
+        self.assertNotIn("return 2\n", result)
+        self.assertIn("return 3", result)
+        self.assertTrue(result.endswith("CONSTANT = 4\n\n\ndef last():\n    pass\n"))
+
+    def test_splice_rejects_invalid_python(self):
+        sections = split_sections(LARGE_MODULE)
+        with self.assertRaises(SpliceError):
+            splice_sections(LARGE_MODULE, {1: "def first(:"}, sections)
+
+class TestSectionalImplementation(SweDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.path = os.path.join(self.tmp_path, "big.py")
+        with open(self.path, "w") as f:
+            f.write(LARGE_MODULE)
+
+    @mock.patch("swe.graph.LARGE_FILE_TOKENS", 5)
+    def test_only_planned_sections_are_regenerated(self):
+        prompts = []
+
+        class FakeSectionModel:
+            def with_structured_output(inner_self, schema):
+                def respond(prompt):
+                    prompts.append(prompt.to_string())
+                    if schema is SectionPlan:
+                        return SectionPlan(file=self.path, sections=[1], append_new_code=False, next_file_to_implement="None")
+                    return SectionResponse(content="```python\ndef first():\n    return 10\n```")
+                return RunnableLambda(respond)
+
+        router = ModelRouter(swe_dir=self.swe_dir, llm_factory=lambda route: FakeSectionModel())
+        node = ImplementationNode(self.swe_context, router)
+        state = {"question": "change first", "plan": "edit first", "current_file": "", "next_file": self.path, "implementation": None, "verbose": False}
+
+        response = node(state)["implementation"]
+        self.assertEqual(len(prompts), 2)
+        self.assertIn("[1] def first", prompts[0])
+        self.assertEqual(response.content, LARGE_MODULE.replace("@decorator\ndef first():\n    return 1", "def first():\n    return 10"))
+
+    def _run(self, respond, next_file):
+        class FakeModel:
+            def with_structured_output(inner_self, schema):
+                return RunnableLambda(lambda prompt: respond(schema, prompt.to_string()))
+
+        router = ModelRouter(swe_dir=self.swe_dir, llm_factory=lambda route: FakeModel())
+        state = {"question": "change first", "plan": "edit first", "current_file": "", "next_file": next_file, "implementation": None, "verbose": False}
+        return ImplementationNode(self.swe_context, router)(state)["implementation"]
+
+    @mock.patch("swe.graph.LARGE_FILE_TOKENS", 5)
+    def test_first_iteration_offers_large_context_files(self):
+        schemas = []
+
+        def respond(schema, prompt):
+            schemas.append(schema)
+            if schema is SectionPlan:
+                self.assertIn("[1] def first", prompt)
+                return SectionPlan(file=self.path, sections=[1], append_new_code=False, next_file_to_implement="None")
+            return SectionResponse(content="def first():\n    return 10")
+
+        # No next file is known yet, but a large file is in context
+        self.swe_context.add_file(self.path)
+        response = self._run(respond, "")
+        self.assertEqual(schemas, [SectionPlan, SectionResponse])
+        self.assertIn("return 10", response.content)
+
+    @mock.patch("swe.graph.LARGE_FILE_TOKENS", 5)
+    def test_no_large_files_uses_single_call(self):
+        schemas = []
+
+        def respond(schema, prompt):
+            schemas.append(schema)
+            return ImplementResponse(file=self.path, content="a = 1\n", next_file_to_implement="None")
+
+        self._run(respond, "")
+        self.assertEqual(schemas, [ImplementResponse])
+
+    @mock.patch("swe.graph.LARGE_FILE_TOKENS", 5)
+    def test_unsplicable_section_is_regenerated(self):
+        section_prompts = []
+
+        def respond(schema, prompt):
+            if schema is SectionPlan:
+                return SectionPlan(file=self.path, sections=[1, 3], append_new_code=False, next_file_to_implement="None")
+            section_prompts.append(prompt)
+            if "CONSTANT" in prompt.split("Rewrite this section")[-1]:
+                return SectionResponse(content="CONSTANT = 40")
+            if "did not parse" in prompt:
+                return SectionResponse(content="def first():\n    return 10")
+            return SectionResponse(content="def first(:")
+
+        response = self._run(respond, self.path)
+        self.assertEqual(len(section_prompts), 3)
+        self.assertIn("return 10", response.content)
+        self.assertIn("CONSTANT = 40", response.content)
+
+    @mock.patch("swe.graph.LARGE_FILE_TOKENS", 5)
+    def test_falls_back_to_full_rewrite_when_splice_keeps_failing(self):
+        schemas = []
+
+        def respond(schema, prompt):
+            schemas.append(schema)
+            if schema is SectionPlan:
+                return SectionPlan(file=self.path, sections=[1], append_new_code=False, next_file_to_implement="None")
+            if schema is SectionResponse:
+                return SectionResponse(content="def first(:")
+            return ImplementResponse(file=self.path, content="def first():\n    return 10\n", next_file_to_implement="None")
+
+        response = self._run(respond, self.path)
+        self.assertEqual(schemas, [SectionPlan, SectionResponse, SectionResponse, ImplementResponse])
+        self.assertEqual(response.content, "def first():\n    return 10\n")
+
+    def test_new_python_file_must_parse(self):
+        path = os.path.join(self.tmp_path, "new.py")
+        state = {"question": "", "plan": "", "current_file": "", "next_file": "",
+                 "implementation": ImplementResponse(file=path, content="def broken(:\n", next_file_to_implement="None"),
+                 "verbose": False}
+        self.assertEqual(FileWriterNode(self.swe_context)(state)["next_file"], "None")
+        self.assertFalse(os.path.exists(path))
+        # A refused file leaves no record claiming it was changed
+        self.assertEqual(self.swe_context._load_chat_history(), [])
+
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()